@@ -8,6 +8,7 @@ Uses Firecrawl for web scraping and Google Generative AI for code generation.
 import os
 import sys
 
+import anyio
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
 
@@ -17,7 +18,7 @@ load_dotenv()
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "src"))
 
-from mirage.tools import register_tools
+from mirage.tools import close_services, register_tools
 
 
 def create_server() -> FastMCP:
@@ -33,5 +34,18 @@ def create_server() -> FastMCP:
 # Create server instance
 mcp = create_server()
 
+
+async def serve() -> None:
+    """Run the server over stdio, closing shared service clients on shutdown.
+
+    FastMCP enters its lifespan once per session, not once per process, so
+    the shared clients are closed here rather than in a lifespan hook.
+    """
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await close_services()
+
+
 if __name__ == "__main__":
-    mcp.run()
+    anyio.run(serve)
@@ -1,12 +1,21 @@
-"""Pydantic schemas for brand data structures."""
+"""Pydantic schemas for brand data structures.
 
-from typing import Optional
-from pydantic import BaseModel, Field
+Leaf value objects that are only built internally from already-parsed data
+(button styles, spacing, comparison metrics) are plain slotted dataclasses so
+constructing them skips pydantic validation. Pydantic still validates them
+when they arrive nested inside a model at the MCP boundary.
+"""
+
+from dataclasses import dataclass, field
+from typing import Annotated, Optional
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 
 
 class BrandColors(BaseModel):
     """Color palette extracted from a website."""
 
+    model_config = ConfigDict(frozen=True)
+
     primary: str = Field(description="Primary brand color in hex format")
     secondary: Optional[str] = Field(default=None, description="Secondary brand color")
     accent: Optional[str] = Field(default=None, description="Accent color")
@@ -18,6 +27,8 @@ class BrandColors(BaseModel):
 class BrandTypography(BaseModel):
     """Typography settings extracted from a website."""
 
+    model_config = ConfigDict(frozen=True)
+
     headings: str = Field(description="Font family for headings")
     body: str = Field(description="Font family for body text")
     weights: list[int] = Field(default_factory=lambda: [400, 600, 700], description="Available font weights")
@@ -25,24 +36,30 @@ class BrandTypography(BaseModel):
     line_height: Optional[str] = Field(default="1.5", description="Default line height")
 
 
-class BrandSpacing(BaseModel):
+@dataclass(slots=True, frozen=True)
+class BrandSpacing:
     """Spacing system extracted from a website."""
 
-    grid: str = Field(default="8px", description="Base grid unit")
-    margins: dict[str, str] = Field(default_factory=dict, description="Margin values")
-    padding: dict[str, str] = Field(default_factory=dict, description="Padding values")
-    gap: Optional[str] = Field(default=None, description="Default gap between elements")
+    grid: Annotated[str, Field(description="Base grid unit")] = "8px"
+    margins: Annotated[dict[str, str], Field(description="Margin values")] = field(
+        default_factory=dict
+    )
+    padding: Annotated[dict[str, str], Field(description="Padding values")] = field(
+        default_factory=dict
+    )
+    gap: Annotated[Optional[str], Field(description="Default gap between elements")] = None
 
 
-class ButtonStyle(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ButtonStyle:
     """Individual button style."""
 
-    bg: str = Field(description="Background color")
-    text: str = Field(description="Text color")
-    border_radius: str = Field(default="4px", description="Border radius")
-    padding: str = Field(default="12px 24px", description="Button padding")
-    border: Optional[str] = Field(default=None, description="Border style")
-    hover_bg: Optional[str] = Field(default=None, description="Hover background color")
+    bg: Annotated[str, Field(description="Background color")]
+    text: Annotated[str, Field(description="Text color")]
+    border_radius: Annotated[str, Field(description="Border radius")] = "4px"
+    padding: Annotated[str, Field(description="Button padding")] = "12px 24px"
+    border: Annotated[Optional[str], Field(description="Border style")] = None
+    hover_bg: Annotated[Optional[str], Field(description="Hover background color")] = None
 
 
 class BrandButtons(BaseModel):
@@ -63,7 +80,10 @@ class BrandData(BaseModel):
     buttons: BrandButtons = Field(default_factory=BrandButtons, description="Button styles")
     logo_url: Optional[str] = Field(default=None, description="URL to the logo if found")
     favicon_url: Optional[str] = Field(default=None, description="URL to the favicon if found")
-    screenshots: list[str] = Field(default_factory=list, description="Screenshot URLs if requested")
+    screenshots: list[str] = Field(
+        default_factory=list,
+        description="Screenshot references (URLs or file:// paths) if requested",
+    )
 
 
 class GeneratedCode(BaseModel):
@@ -75,13 +95,25 @@ class GeneratedCode(BaseModel):
     component_type: Optional[str] = Field(default=None, description="Type of component generated")
 
 
-class ComparisonMetrics(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ComparisonMetrics:
     """Comparison metrics between two brands."""
 
-    color_similarity: float = Field(ge=0, le=1, description="Color similarity score (0-1)")
-    typography_match: bool = Field(description="Whether typography fonts match")
-    font_overlap: list[str] = Field(default_factory=list, description="Shared fonts")
-    differences: list[str] = Field(default_factory=list, description="Key differences found")
+    color_similarity: Annotated[
+        float, Field(ge=0, le=1, description="Color similarity score (0-1)")
+    ]
+    typography_match: Annotated[bool, Field(description="Whether typography fonts match")]
+    font_overlap: Annotated[list[str], Field(description="Shared fonts")] = field(
+        default_factory=list
+    )
+    differences: Annotated[list[str], Field(description="Key differences found")] = field(
+        default_factory=list
+    )
+
+    def __post_init__(self):
+        # Pydantic does not revalidate dataclass instances, so enforce the bound here
+        if not 0 <= self.color_similarity <= 1:
+            raise ValueError("color_similarity must be between 0 and 1")
 
 
 class BrandComparison(BaseModel):
@@ -90,3 +122,9 @@ class BrandComparison(BaseModel):
     site1: BrandData = Field(description="Brand data from first site")
     site2: BrandData = Field(description="Brand data from second site")
     comparison: ComparisonMetrics = Field(description="Comparison metrics")
+
+
+# Prebuilt adapters for validating untrusted input: brand data at the MCP
+# boundary, and button styles parsed from vision model replies
+BRAND_ADAPTER = TypeAdapter(BrandData)
+BUTTON_STYLE_ADAPTER = TypeAdapter(ButtonStyle)
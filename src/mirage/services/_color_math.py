@@ -0,0 +1,29 @@
+"""Color math helpers for brand comparison."""
+
+import math
+
+# Distance between black and white in RGB space
+MAX_RGB_DISTANCE = math.sqrt(3 * 255 ** 2)
+
+
+def hex_to_rgb(hex_color: str) -> bytes:
+    """Parse a hex color into its three RGB channel bytes.
+
+    Args:
+        hex_color: Color in #RRGGBB format (leading # optional)
+
+    Returns:
+        Three bytes holding the red, green and blue channels
+
+    Raises:
+        ValueError: If the string is not a valid hex color
+    """
+    rgb = bytes.fromhex(hex_color.lstrip("#")[:6])
+    if len(rgb) != 3:
+        raise ValueError(f"Invalid hex color: {hex_color}")
+    return rgb
+
+
+def color_similarity(color1: str, color2: str) -> float:
+    """Return the RGB similarity of two hex colors, from 0 to 1."""
+    return 1 - math.dist(hex_to_rgb(color1), hex_to_rgb(color2)) / MAX_RGB_DISTANCE
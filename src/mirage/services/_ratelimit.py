@@ -0,0 +1,139 @@
+"""Client-side rate limiting for outbound API calls."""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping, Optional
+
+
+class SlidingWindow:
+    """Requests-per-minute guard over a sliding time window."""
+
+    def __init__(self, rpm_limit: int, window: float = 60.0):
+        """Initialize the window.
+
+        Args:
+            rpm_limit: Maximum requests per window. 0 disables the guard.
+            window: Window length in seconds
+        """
+        self.rpm_limit = rpm_limit
+        self.window = window
+        self._sent: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Wait until another request fits in the window, then record it."""
+        if self.rpm_limit <= 0:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= self.window:
+                self._sent.popleft()
+
+            if len(self._sent) >= self.rpm_limit:
+                await asyncio.sleep(self.window - (now - self._sent[0]))
+                self._sent.popleft()
+                now = time.monotonic()
+
+            self._sent.append(now)
+
+
+class AIMDController:
+    """Adaptive concurrency limit using additive-increase/multiplicative-decrease.
+
+    Each fast, successful response raises the limit by ``alpha``; a 429 or 5xx
+    response, or a provider reporting under 10% of its quota left, multiplies
+    it by ``beta``. Slow successes hold the limit steady.
+    """
+
+    def __init__(
+        self,
+        c_min: int = 1,
+        c_max: int = 16,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        latency_target: float = 30.0,
+        initial: float = 4.0,
+    ):
+        """Initialize the controller.
+
+        Args:
+            c_min: Lowest concurrency limit
+            c_max: Highest concurrency limit
+            alpha: Additive increase per fast success
+            beta: Multiplicative decrease factor on throttling
+            latency_target: Responses slower than this (seconds) do not raise the limit
+            initial: Starting concurrency limit
+        """
+        self.c_min = c_min
+        self.c_max = c_max
+        self.alpha = alpha
+        self.beta = beta
+        self.latency_target = latency_target
+        self.c = float(min(max(initial, c_min), c_max))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        """Current number of requests allowed in flight."""
+        return max(self.c_min, int(self.c))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one concurrency slot, honouring any Retry-After pause."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def record(
+        self,
+        latency: float,
+        status_code: int,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        """Adjust the limit from a completed request.
+
+        Args:
+            latency: Request duration in seconds
+            status_code: HTTP status of the response
+            headers: Response headers, checked for rate-limit hints
+        """
+        throttled = status_code == 429 or status_code >= 500
+
+        if headers is not None:
+            retry_after = _parse_float(headers.get("Retry-After"))
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+            remaining = _parse_float(headers.get("X-RateLimit-Remaining"))
+            quota = _parse_float(headers.get("X-RateLimit-Limit"))
+            if remaining is not None and quota and remaining < 0.1 * quota:
+                throttled = True
+
+        if throttled:
+            self.c = max(float(self.c_min), self.c * self.beta)
+        elif latency <= self.latency_target:
+            self.c = min(float(self.c_max), self.c + self.alpha)
+
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    """Parse a numeric header value, ignoring missing or non-numeric values."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
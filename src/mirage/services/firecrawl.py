@@ -1,7 +1,18 @@
 """Firecrawl API service for web scraping and brand extraction."""
 
+import asyncio
+import atexit
+import base64
+import binascii
+import hashlib
 import os
-from typing import Optional
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 
 import httpx
 
@@ -13,32 +24,179 @@ from ..schemas.brand import (
     BrandButtons,
     ButtonStyle,
 )
+from ._ratelimit import AIMDController, SlidingWindow
+
+
+# Shared read-only fallback for missing sections of a Firecrawl response
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+# Inline screenshot types written to disk, by MIME type; others stay inline
+_SCREENSHOT_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+# Private per-process directory for stashed screenshots, created on first use
+_screenshot_dir: Optional[Path] = None
+_screenshot_dir_lock = threading.Lock()
+
+# Most screenshots kept on disk; matches the brand cache size so cached
+# brands' references normally stay valid while the directory stays bounded
+SCREENSHOT_MAX_FILES = 256
+_screenshot_files_lock = threading.Lock()
+
+
+def _css_length(value: Any, default: Optional[str]) -> Optional[str]:
+    """Return a CSS length from a branding value, adding px to bare numbers."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, (int, float)):
+        return f"{value:g}px"
+    return str(value)
+
+
+def _font_weights(values: Any) -> list[int]:
+    """Return the numeric font weights, skipping names like "bold"."""
+    weights = []
+    for value in values:
+        try:
+            weights.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return weights or [400, 600, 700]
+
+
+def _get_screenshot_dir() -> Path:
+    """Return this process's screenshot directory, creating it on first use.
+
+    mkdtemp picks an unpredictable name and makes the directory owner-only,
+    so other users on the host cannot pre-create or read it. It is removed
+    when the interpreter exits.
+    """
+    global _screenshot_dir
+    # Stashing runs in worker threads, so guard the one-time creation
+    with _screenshot_dir_lock:
+        if _screenshot_dir is None:
+            _screenshot_dir = Path(tempfile.mkdtemp(prefix="mirage-"))
+            atexit.register(shutil.rmtree, _screenshot_dir, ignore_errors=True)
+        return _screenshot_dir
+
+
+def _stash_screenshot(screenshot: str) -> str:
+    """Write a base64 data-URL screenshot to disk and return a file:// URI.
+
+    Screenshots that are already URLs, are not a known image type, or do not
+    decode are returned unchanged. Files are named by content hash, so
+    repeated captures of the same image are written once. Past
+    ``SCREENSHOT_MAX_FILES``, the least recently stashed files are deleted.
+    """
+    header, sep, payload = screenshot.partition(",")
+    if not (sep and header.startswith("data:")):
+        return screenshot
+
+    mime, *params = header[5:].split(";")
+    extension = _SCREENSHOT_EXTENSIONS.get(mime.lower())
+    if extension is None or params[-1:] != ["base64"]:
+        return screenshot
+
+    try:
+        image = base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        return screenshot
+
+    directory = _get_screenshot_dir()
+    path = directory / f"{hashlib.sha1(image).hexdigest()}.{extension}"
+    with _screenshot_files_lock:
+        if path.exists():
+            # Refresh so a re-stashed image counts as recent when pruning
+            path.touch()
+        else:
+            path.write_bytes(image)
+            _prune_screenshots(directory)
+    return path.as_uri()
+
+
+def _prune_screenshots(directory: Path) -> None:
+    """Delete the oldest screenshots beyond ``SCREENSHOT_MAX_FILES``."""
+    files = sorted(directory.iterdir(), key=lambda p: p.stat().st_mtime)
+    for stale in files[:-SCREENSHOT_MAX_FILES]:
+        stale.unlink(missing_ok=True)
 
 
 class FirecrawlService:
     """Async client for Firecrawl API."""
 
     BASE_URL = "https://api.firecrawl.dev/v1"
+    DEFAULT_CACHE_TTL = 3600.0
+    CACHE_MAX_ENTRIES = 256
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+        rpm_limit: Optional[int] = None,
+    ):
         """Initialize the Firecrawl service.
 
         Args:
             api_key: Firecrawl API key. If not provided, reads from FIRECRAWL_API_KEY env var.
+            cache_ttl: Seconds to cache extracted brands per URL. If not provided, reads
+                from MIRAGE_CACHE_TTL env var (default 3600). 0 disables caching.
+            rpm_limit: Maximum requests per minute. If not provided, reads from
+                FIRECRAWL_RPM_LIMIT env var (default 0, meaning no limit).
         """
         self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
         if not self.api_key:
             raise ValueError("FIRECRAWL_API_KEY is required")
 
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("MIRAGE_CACHE_TTL", self.DEFAULT_CACHE_TTL))
+        self.cache_ttl = cache_ttl
+        # (url, include_screenshots) -> (expires_at, brand)
+        self._brand_cache: dict[tuple[str, bool], tuple[float, BrandData]] = {}
+        # (url, include_screenshots) -> extraction in flight, shared by concurrent callers
+        self._pending: dict[tuple[str, bool], asyncio.Task[BrandData]] = {}
+
+        if rpm_limit is None:
+            rpm_limit = int(os.getenv("FIRECRAWL_RPM_LIMIT", "0"))
+        self._window = SlidingWindow(rpm_limit)
+        self._limiter = AIMDController()
+
         self.client = httpx.AsyncClient(
             base_url=self.BASE_URL,
             headers={
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json",
             },
-            timeout=60.0,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            # HTTP/2 multiplexes concurrent scrapes over one connection; retries
+            # only cover connection failures, so POSTs are never replayed.
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=32,
+                    max_connections=64,
+                    keepalive_expiry=30.0,
+                ),
+                retries=2,
+            ),
         )
 
+    async def _post(self, path: str, payload: dict) -> dict:
+        """POST to Firecrawl under the rate limiter and return the JSON body."""
+        async with self._limiter.slot():
+            await self._window.wait()
+            start = time.perf_counter()
+            response = await self.client.post(path, json=payload)
+            self._limiter.record(
+                time.perf_counter() - start, response.status_code, response.headers
+            )
+
+        response.raise_for_status()
+        return response.json()
+
     async def scrape(self, url: str, include_screenshot: bool = False) -> dict:
         """Scrape a URL using Firecrawl.
 
@@ -57,13 +215,15 @@ class FirecrawlService:
         if include_screenshot:
             payload["formats"].append("screenshot")
 
-        response = await self.client.post("/scrape", json=payload)
-        response.raise_for_status()
-        return response.json()
+        return await self._post("/scrape", payload)
 
     async def extract_brand(self, url: str, include_screenshots: bool = False) -> BrandData:
         """Extract brand identity from a website.
 
+        Results are cached per URL for ``cache_ttl`` seconds, and concurrent
+        calls for the same URL share one scrape. Cached instances are shared
+        between callers and must not be mutated.
+
         Args:
             url: The website URL to analyze
             include_screenshots: Whether to capture screenshots
@@ -71,6 +231,39 @@ class FirecrawlService:
         Returns:
             Structured brand data
         """
+        key = (url, include_screenshots)
+        cached = self._brand_cache.get(key)
+        if cached is not None:
+            expires_at, brand = cached
+            if expires_at > time.monotonic():
+                return brand
+            del self._brand_cache[key]
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.create_task(self._fetch_and_cache(key, url, include_screenshots))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        # Shield the shared scrape so one caller being cancelled doesn't cancel it for the rest
+        return await asyncio.shield(pending)
+
+    async def _fetch_and_cache(
+        self, key: tuple[str, bool], url: str, include_screenshots: bool
+    ) -> BrandData:
+        """Fetch a brand and store it in the cache."""
+        brand = await self._fetch_brand(url, include_screenshots)
+
+        if self.cache_ttl > 0:
+            if len(self._brand_cache) >= self.CACHE_MAX_ENTRIES:
+                # Evict the oldest entry (dicts keep insertion order)
+                self._brand_cache.pop(next(iter(self._brand_cache)))
+            self._brand_cache[key] = (time.monotonic() + self.cache_ttl, brand)
+
+        return brand
+
+    async def _fetch_brand(self, url: str, include_screenshots: bool) -> BrandData:
+        """Scrape a website with Firecrawl's branding format and parse the result."""
         # Use Firecrawl's dedicated branding format
         payload = {
             "url": url,
@@ -80,75 +273,83 @@ class FirecrawlService:
         if include_screenshots:
             payload["formats"].append("screenshot")
 
-        response = await self.client.post("/scrape", json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = await self._post("/scrape", payload)
 
         # Parse the branding data from Firecrawl's dedicated endpoint
-        branding = data.get("data", {}).get("branding", {})
+        root = data.get("data") or _EMPTY
+        branding = root.get("branding") or _EMPTY
+        screenshot = root.get("screenshot")
         screenshots = []
 
-        if include_screenshots and "screenshot" in data.get("data", {}):
-            screenshots.append(data["data"]["screenshot"])
+        if include_screenshots and screenshot:
+            screenshots.append(await asyncio.to_thread(_stash_screenshot, screenshot))
+
+        # The models below are built with model_construct and the leaf
+        # dataclasses are not validated, so every value is normalized here:
+        # string fields fall back to defaults on null as well as on missing
+        # keys, and numeric lengths and weights are coerced to their types.
 
         # Extract colors from branding response
-        colors_data = branding.get("colors", {})
-        colors = BrandColors(
-            primary=colors_data.get("primary", "#000000"),
+        colors_data = branding.get("colors") or _EMPTY
+        colors = BrandColors.model_construct(
+            primary=colors_data.get("primary") or "#000000",
             secondary=colors_data.get("secondary"),
             accent=colors_data.get("accent"),
             background=colors_data.get("background"),
             text=colors_data.get("textPrimary"),  # Note: Firecrawl uses "textPrimary"
-            palette=list(colors_data.values()) if colors_data else [],
+            palette=[c for c in colors_data.values() if c],
         )
 
         # Extract typography from branding response
-        typo_data = branding.get("typography", {})
-        font_families = typo_data.get("fontFamilies", {})
-        font_weights = typo_data.get("fontWeights", {})
-        
-        typography = BrandTypography(
-            headings=font_families.get("heading", font_families.get("primary", "sans-serif")),
-            body=font_families.get("primary", "sans-serif"),
-            weights=list(font_weights.values()) if font_weights else [400, 600, 700],
-            base_size=typo_data.get("fontSizes", {}).get("body", "16px"),
+        typo_data = branding.get("typography") or _EMPTY
+        font_families = typo_data.get("fontFamilies") or _EMPTY
+        font_weights = typo_data.get("fontWeights") or _EMPTY
+        body_font = font_families.get("primary") or "sans-serif"
+
+        typography = BrandTypography.model_construct(
+            headings=font_families.get("heading") or body_font,
+            body=body_font,
+            weights=_font_weights(font_weights.values()),
+            base_size=_css_length((typo_data.get("fontSizes") or _EMPTY).get("body"), "16px"),
         )
 
         # Extract spacing from branding response
-        spacing_data = branding.get("spacing", {})
+        spacing_data = branding.get("spacing") or _EMPTY
         spacing = BrandSpacing(
-            grid=f"{spacing_data.get('baseUnit', 8)}px",
+            grid=_css_length(spacing_data.get("baseUnit"), "8px"),
+            gap=_css_length(spacing_data.get("borderRadius"), None),
         )
-        if spacing_data.get("borderRadius"):
-            spacing.gap = spacing_data.get("borderRadius")
 
         # Extract button styles from branding response
-        components = branding.get("components", {})
-        buttons = BrandButtons()
-        
+        components = branding.get("components") or _EMPTY
+        primary_button = None
+        secondary_button = None
+
         if components.get("buttonPrimary"):
             btn = components["buttonPrimary"]
-            buttons.primary = ButtonStyle(
-                bg=btn.get("background", colors.primary),
-                text=btn.get("textColor", "#ffffff"),
-                border_radius=btn.get("borderRadius", "4px"),
+            primary_button = ButtonStyle(
+                bg=btn.get("background") or colors.primary,
+                text=btn.get("textColor") or "#ffffff",
+                border_radius=_css_length(btn.get("borderRadius"), "4px"),
                 padding="12px 24px",  # Firecrawl doesn't always return padding
             )
-        
+
         if components.get("buttonSecondary"):
             btn = components["buttonSecondary"]
-            buttons.secondary = ButtonStyle(
-                bg=btn.get("background", "transparent"),
-                text=btn.get("textColor", colors.primary),
-                border_radius=btn.get("borderRadius", "4px"),
+            secondary_button = ButtonStyle(
+                bg=btn.get("background") or "transparent",
+                text=btn.get("textColor") or colors.primary,
+                border_radius=_css_length(btn.get("borderRadius"), "4px"),
                 padding="12px 24px",
-                border=btn.get("borderColor"),
+                border=btn.get("borderColor") or None,
             )
 
+        buttons = BrandButtons.model_construct(primary=primary_button, secondary=secondary_button)
+
         # Extract images/logos
-        images = branding.get("images", {})
+        images = branding.get("images") or _EMPTY
 
-        return BrandData(
+        return BrandData.model_construct(
             url=url,
             colors=colors,
             typography=typography,
@@ -1,17 +1,93 @@
 """Google Generative AI (Gemini) service for code generation."""
 
 import base64
+import dataclasses
+import functools
 import os
+import re
+import threading
 from typing import Optional
 
 import google.generativeai as genai
 
 from ..schemas.brand import BrandData, GeneratedCode
+from ._color_math import color_similarity
+
+# Invariant prompt fragments, built once at import.
+_PROMPT_REQUIREMENTS = """REQUIREMENTS:
+1. Generate clean, semantic HTML5
+2. Generate CSS that uses the provided CSS variables
+3. Make the component responsive
+4. Use modern CSS (flexbox/grid)
+5. Include hover states for interactive elements
+"""
+
+_PROMPT_OUTPUT_FORMAT = """OUTPUT FORMAT:
+Return the response in this exact format:
+---HTML---
+[Your HTML code here]
+---CSS---
+[Your CSS code here]
+---END---
+"""
+
+_PROMPT_TAIL = "\n".join((_PROMPT_REQUIREMENTS, _PROMPT_OUTPUT_FORMAT))
+
+# Delimited response sections; a missing ---END--- or closing fence runs to
+# the end of the text.
+_RESPONSE_RE = re.compile(r"---HTML---(.*?)---CSS---(.*?)(?:---END---|\Z)", re.DOTALL)
+_FENCE_RE = re.compile(r"```(html|css)(.*?)(?:```|\Z)", re.DOTALL)
+
+# Static parts of the preview document, pre-encoded so only the generated
+# CSS and HTML need encoding per call.
+_PREVIEW_HEAD = b"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>"""
+_PREVIEW_BODY = b"""</style>
+</head>
+<body>
+"""
+_PREVIEW_TAIL = b"""
+</body>
+</html>"""
+_PREVIEW_URL_PREFIX = b"data:text/html;base64,"
+
+_TEMPLATE_PROMPTS = {
+    "hero_section": "Create a hero section with a headline, subheadline, CTA button, and optional image placeholder",
+    "pricing_table": "Create a 3-tier pricing table with features, prices, and CTA buttons",
+    "feature_grid": "Create a 3-column feature grid with icons (use emoji placeholders), titles, and descriptions",
+    "testimonial": "Create a testimonial section with quote, author name, role, and company",
+    "cta": "Create a call-to-action section with headline, description, and primary button",
+}
+
+
+MODEL_NAME = "gemini-2.0-flash-lite"
+
+_model_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_model(api_key: str) -> genai.GenerativeModel:
+    """Configure the SDK and build the model; cached per API key."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+def _get_model(api_key: str) -> genai.GenerativeModel:
+    """Return the process-wide Gemini model, configuring the SDK once per key."""
+    # lru_cache does not stop two threads building the model at once
+    with _model_lock:
+        return _cached_model(api_key)
 
 
 class GeminiService:
     """Async client for Google Generative AI (Gemini)."""
 
+    CSS_CACHE_MAX_ENTRIES = 128
+
     def __init__(self, api_key: Optional[str] = None):
         """Initialize the Gemini service.
 
@@ -22,30 +98,62 @@ class GeminiService:
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY is required")
 
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash-lite")
+        self.model = _get_model(self.api_key)
+        self._css_cache: dict[tuple, str] = {}
+
+    def _css_variables_for(self, brand: BrandData) -> str:
+        """Return the CSS custom properties for a brand, reusing earlier results.
+
+        The key holds every field ``_brand_to_css_variables`` reads, so brands
+        that render the same variables share one entry.
+        """
+        colors = brand.colors
+        key = (
+            colors.primary,
+            colors.secondary,
+            colors.accent,
+            colors.background,
+            colors.text,
+            brand.typography.headings,
+            brand.typography.body,
+            brand.spacing.grid,
+            brand.buttons.primary,
+        )
+        css_variables = self._css_cache.get(key)
+        if css_variables is None:
+            if len(self._css_cache) >= self.CSS_CACHE_MAX_ENTRIES:
+                self._css_cache.clear()
+            css_variables = self._css_cache[key] = self._brand_to_css_variables(brand)
+        return css_variables
 
     def _brand_to_css_variables(self, brand: BrandData) -> str:
         """Convert brand data to CSS custom properties."""
-        css_vars = []
-        css_vars.append(f"  --color-primary: {brand.colors.primary};")
-        if brand.colors.secondary:
-            css_vars.append(f"  --color-secondary: {brand.colors.secondary};")
-        if brand.colors.accent:
-            css_vars.append(f"  --color-accent: {brand.colors.accent};")
-        if brand.colors.background:
-            css_vars.append(f"  --color-background: {brand.colors.background};")
-        if brand.colors.text:
-            css_vars.append(f"  --color-text: {brand.colors.text};")
-
-        css_vars.append(f"  --font-heading: {brand.typography.headings};")
-        css_vars.append(f"  --font-body: {brand.typography.body};")
-        css_vars.append(f"  --spacing-grid: {brand.spacing.grid};")
-
-        if brand.buttons.primary:
-            css_vars.append(f"  --btn-primary-bg: {brand.buttons.primary.bg};")
-            css_vars.append(f"  --btn-primary-text: {brand.buttons.primary.text};")
-            css_vars.append(f"  --btn-primary-radius: {brand.buttons.primary.border_radius};")
+        colors = brand.colors
+        typography = brand.typography
+        button = brand.buttons.primary
+
+        css_vars = [f"  --color-primary: {colors.primary};"]
+        if colors.secondary:
+            css_vars.append(f"  --color-secondary: {colors.secondary};")
+        if colors.accent:
+            css_vars.append(f"  --color-accent: {colors.accent};")
+        if colors.background:
+            css_vars.append(f"  --color-background: {colors.background};")
+        if colors.text:
+            css_vars.append(f"  --color-text: {colors.text};")
+
+        css_vars += (
+            f"  --font-heading: {typography.headings};",
+            f"  --font-body: {typography.body};",
+            f"  --spacing-grid: {brand.spacing.grid};",
+        )
+
+        if button:
+            css_vars += (
+                f"  --btn-primary-bg: {button.bg};",
+                f"  --btn-primary-text: {button.text};",
+                f"  --btn-primary-radius: {button.border_radius};",
+            )
 
         return "\n".join(css_vars)
 
@@ -65,9 +173,9 @@ class GeminiService:
         Returns:
             Generated HTML and CSS code
         """
-        css_variables = self._brand_to_css_variables(brand_data)
+        css_variables = self._css_variables_for(brand_data)
 
-        prompt = f"""Generate a {component_type} component using these brand specifications:
+        header = f"""Generate a {component_type} component using these brand specifications:
 
 BRAND DATA:
 - Primary Color: {brand_data.colors.primary}
@@ -77,7 +185,7 @@ BRAND DATA:
 - Text Color: {brand_data.colors.text or '#000000'}
 - Heading Font: {brand_data.typography.headings}
 - Body Font: {brand_data.typography.body}
-- Button Style: {brand_data.buttons.primary.model_dump() if brand_data.buttons.primary else 'Default'}
+- Button Style: {dataclasses.asdict(brand_data.buttons.primary) if brand_data.buttons.primary else 'Default'}
 
 CSS VARIABLES (use these):
 :root {{
@@ -88,21 +196,8 @@ COMPONENT TYPE: {component_type}
 
 {f"ADDITIONAL INSTRUCTIONS: {customization}" if customization else ""}
 
-REQUIREMENTS:
-1. Generate clean, semantic HTML5
-2. Generate CSS that uses the provided CSS variables
-3. Make the component responsive
-4. Use modern CSS (flexbox/grid)
-5. Include hover states for interactive elements
-
-OUTPUT FORMAT:
-Return the response in this exact format:
----HTML---
-[Your HTML code here]
----CSS---
-[Your CSS code here]
----END---
 """
+        prompt = "".join((header, _PROMPT_TAIL))
 
         response = await self.model.generate_content_async(prompt)
         text = response.text
@@ -111,23 +206,17 @@ Return the response in this exact format:
         html = ""
         css = ""
 
-        if "---HTML---" in text and "---CSS---" in text:
-            parts = text.split("---HTML---")
-            if len(parts) > 1:
-                html_part = parts[1].split("---CSS---")[0].strip()
-                html = html_part
-
-            if "---CSS---" in text:
-                css_parts = text.split("---CSS---")
-                if len(css_parts) > 1:
-                    css_part = css_parts[1].split("---END---")[0].strip()
-                    css = css_part
+        match = _RESPONSE_RE.search(text)
+        if match:
+            html = match.group(1).strip()
+            css = match.group(2).strip()
         else:
             # Fallback: try to extract code blocks
-            if "```html" in text:
-                html = text.split("```html")[1].split("```")[0].strip()
-            if "```css" in text:
-                css = text.split("```css")[1].split("```")[0].strip()
+            blocks: dict[str, str] = {}
+            for block in _FENCE_RE.finditer(text):
+                blocks.setdefault(block.group(1), block.group(2))
+            html = blocks.get("html", "").strip()
+            css = blocks.get("css", "").strip()
 
         # Add CSS variables to the CSS
         full_css = f""":root {{
@@ -137,19 +226,11 @@ Return the response in this exact format:
 {css}"""
 
         # Create preview URL (data URL)
-        preview_html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>{full_css}</style>
-</head>
-<body>
-{html}
-</body>
-</html>"""
+        preview_html = b"".join(
+            (_PREVIEW_HEAD, full_css.encode(), _PREVIEW_BODY, html.encode(), _PREVIEW_TAIL)
+        )
 
-        preview_url = f"data:text/html;base64,{base64.b64encode(preview_html.encode()).decode()}"
+        preview_url = (_PREVIEW_URL_PREFIX + base64.b64encode(preview_html)).decode("ascii")
 
         return GeneratedCode(
             html=html,
@@ -172,15 +253,7 @@ Return the response in this exact format:
         Returns:
             Generated HTML and CSS code
         """
-        template_prompts = {
-            "hero_section": "Create a hero section with a headline, subheadline, CTA button, and optional image placeholder",
-            "pricing_table": "Create a 3-tier pricing table with features, prices, and CTA buttons",
-            "feature_grid": "Create a 3-column feature grid with icons (use emoji placeholders), titles, and descriptions",
-            "testimonial": "Create a testimonial section with quote, author name, role, and company",
-            "cta": "Create a call-to-action section with headline, description, and primary button",
-        }
-
-        customization = template_prompts.get(
+        customization = _TEMPLATE_PROMPTS.get(
             template_type,
             f"Create a {template_type} component"
         )
@@ -197,19 +270,7 @@ Return the response in this exact format:
         Returns:
             Similarity score between 0 and 1
         """
-        def hex_to_rgb(hex_color: str) -> tuple:
-            hex_color = hex_color.lstrip("#")
-            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
         try:
-            rgb1 = hex_to_rgb(color1)
-            rgb2 = hex_to_rgb(color2)
-
-            # Calculate Euclidean distance in RGB space
-            distance = sum((a - b) ** 2 for a, b in zip(rgb1, rgb2)) ** 0.5
-            max_distance = (255 ** 2 * 3) ** 0.5  # Max possible distance
-
-            similarity = 1 - (distance / max_distance)
-            return round(similarity, 3)
-        except (ValueError, IndexError):
+            return round(color_similarity(color1, color2), 3)
+        except ValueError:
             return 0.0
@@ -12,7 +12,7 @@ from ..schemas.brand import (
     BrandTypography,
     BrandSpacing,
     BrandButtons,
-    ButtonStyle,
+    BUTTON_STYLE_ADAPTER,
 )
 
 
@@ -173,29 +173,30 @@ GUIDELINES:
             weights=typo_data.get("weights", [400, 600, 700]),
         )
 
-        # Build BrandButtons
+        # Build BrandButtons; ButtonStyle is a dataclass, so the model's reply
+        # is validated explicitly rather than by the constructor
         buttons = BrandButtons()
         buttons_data = data.get("buttons", {})
 
         if buttons_data.get("primary"):
             btn = buttons_data["primary"]
-            buttons.primary = ButtonStyle(
-                bg=btn.get("bg", colors.primary),
-                text=btn.get("text", "#ffffff"),
-                border_radius=btn.get("border_radius", "4px"),
-                padding="12px 24px",
-                border=btn.get("border") if btn.get("has_border") else None,
-            )
+            buttons.primary = BUTTON_STYLE_ADAPTER.validate_python({
+                "bg": btn.get("bg", colors.primary),
+                "text": btn.get("text", "#ffffff"),
+                "border_radius": btn.get("border_radius", "4px"),
+                "padding": "12px 24px",
+                "border": btn.get("border") if btn.get("has_border") else None,
+            })
 
         if buttons_data.get("secondary"):
             btn = buttons_data["secondary"]
-            buttons.secondary = ButtonStyle(
-                bg=btn.get("bg", "transparent"),
-                text=btn.get("text", colors.primary),
-                border_radius=btn.get("border_radius", "4px"),
-                padding="12px 24px",
-                border=btn.get("border") if btn.get("has_border") else None,
-            )
+            buttons.secondary = BUTTON_STYLE_ADAPTER.validate_python({
+                "bg": btn.get("bg", "transparent"),
+                "text": btn.get("text", colors.primary),
+                "border_radius": btn.get("border_radius", "4px"),
+                "padding": "12px 24px",
+                "border": btn.get("border") if btn.get("has_border") else None,
+            })
 
         return BrandData(
             url=source_url,
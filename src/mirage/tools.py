@@ -1,14 +1,121 @@
 """MCP tool implementations for brand extraction and replication."""
 
+import asyncio
+import threading
 from typing import Optional
+from urllib.parse import urlsplit
 
 from mcp.server.fastmcp import FastMCP
 
-from .schemas.brand import BrandData, GeneratedCode, BrandComparison, ComparisonMetrics
+from .schemas.brand import BRAND_ADAPTER, BrandComparison, BrandData, ComparisonMetrics
 from .services.firecrawl import FirecrawlService
 from .services.gemini import GeminiService
 from .services.vision import VisionService
 
+# Service singletons shared across tool invocations so the underlying HTTP
+# connection pools stay warm for the lifetime of the server.
+_firecrawl: Optional[FirecrawlService] = None
+_gemini: Optional[GeminiService] = None
+_vision: Optional[VisionService] = None
+_gemini_lock = threading.Lock()
+
+
+def get_firecrawl() -> FirecrawlService:
+    """Return the shared FirecrawlService, creating it on first use."""
+    global _firecrawl
+    if _firecrawl is None:
+        _firecrawl = FirecrawlService()
+    return _firecrawl
+
+
+def get_gemini() -> GeminiService:
+    """Return the shared GeminiService, creating it on first use."""
+    global _gemini
+    if _gemini is None:
+        # May run in a worker thread via ensure_gemini()
+        with _gemini_lock:
+            if _gemini is None:
+                _gemini = GeminiService()
+    return _gemini
+
+
+async def ensure_gemini() -> GeminiService:
+    """Return the shared GeminiService, building it off the event loop if needed.
+
+    Gemini SDK setup is synchronous, so first-time construction runs in a
+    worker thread where it can overlap with an in-flight scrape.
+    """
+    if _gemini is not None:
+        return _gemini
+    return await asyncio.to_thread(get_gemini)
+
+
+def get_vision() -> VisionService:
+    """Return the shared VisionService, creating it on first use."""
+    global _vision
+    if _vision is None:
+        _vision = VisionService()
+    return _vision
+
+
+async def close_services() -> None:
+    """Close any services created by the getters and reset them."""
+    global _firecrawl, _gemini, _vision
+    if _firecrawl is not None:
+        await _firecrawl.close()
+        _firecrawl = None
+    if _vision is not None:
+        await _vision.close()
+        _vision = None
+    _gemini = None
+
+
+def _normalize_url(url: str) -> tuple[str, str, str, str]:
+    """Reduce a URL to the parts that identify a page for comparison."""
+    parts = urlsplit(url.strip())
+    return (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query)
+
+
+async def _compare_brand_data(
+    brand1: BrandData, brand2: BrandData, gemini: GeminiService
+) -> ComparisonMetrics:
+    """Compute similarity metrics and differences between two brands."""
+    # Calculate color similarity
+    color_similarity = await gemini.calculate_color_similarity(
+        brand1.colors.primary,
+        brand2.colors.primary,
+    )
+
+    # Normalize font names once for all comparisons below
+    headings1 = brand1.typography.headings.lower()
+    body1 = brand1.typography.body.lower()
+    headings2 = brand2.typography.headings.lower()
+    body2 = brand2.typography.body.lower()
+    headings_match = headings1 == headings2
+    body_match = body1 == body2
+
+    # Check typography match
+    typography_match = headings_match or body_match
+
+    # Find font overlap
+    font_overlap = list({headings1, body1} & {headings2, body2})
+
+    # Identify differences
+    differences = []
+    if brand1.colors.primary != brand2.colors.primary:
+        differences.append(f"Primary color: {brand1.colors.primary} vs {brand2.colors.primary}")
+    if not headings_match:
+        differences.append(f"Heading font: {brand1.typography.headings} vs {brand2.typography.headings}")
+    if not body_match:
+        differences.append(f"Body font: {brand1.typography.body} vs {brand2.typography.body}")
+
+    return ComparisonMetrics(
+        color_similarity=color_similarity,
+        typography_match=typography_match,
+        font_overlap=font_overlap,
+        differences=differences,
+    )
+
 
 def register_tools(mcp: FastMCP) -> None:
     """Register all brand extraction tools with the MCP server."""
@@ -27,12 +134,8 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Brand data including colors, typography, spacing, and buttons
         """
-        firecrawl = FirecrawlService()
-        try:
-            brand_data = await firecrawl.extract_brand(url, include_screenshots)
-            return brand_data.model_dump()
-        finally:
-            await firecrawl.close()
+        brand_data = await get_firecrawl().extract_brand(url, include_screenshots)
+        return brand_data.model_dump(exclude_none=True)
 
     @mcp.tool()
     async def generate_replica(
@@ -53,11 +156,11 @@ def register_tools(mcp: FastMCP) -> None:
             Generated HTML and CSS code with preview URL
         """
         # Parse brand data back into Pydantic model
-        brand = BrandData.model_validate(brand_data)
+        brand = BRAND_ADAPTER.validate_python(brand_data)
 
-        gemini = GeminiService()
+        gemini = await ensure_gemini()
         result = await gemini.generate_replica(brand, component_type, customization)
-        return result.model_dump()
+        return result.model_dump(exclude_none=True)
 
     @mcp.tool()
     async def replicate_website(
@@ -78,18 +181,15 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Both brand_data and generated HTML/CSS
         """
-        firecrawl = FirecrawlService()
-        try:
-            brand_data = await firecrawl.extract_brand(url, include_screenshots=False)
-        finally:
-            await firecrawl.close()
-
-        gemini = GeminiService()
+        brand_data, gemini = await asyncio.gather(
+            get_firecrawl().extract_brand(url, include_screenshots=False),
+            ensure_gemini(),
+        )
         generated = await gemini.generate_replica(brand_data, component_type, customization)
 
         return {
-            "brand_data": brand_data.model_dump(),
-            "generated": generated.model_dump(),
+            "brand_data": brand_data.model_dump(exclude_none=True),
+            "generated": generated.model_dump(exclude_none=True),
         }
 
     @mcp.tool()
@@ -106,54 +206,32 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Brand data for both sites with similarity scores and differences
         """
-        firecrawl = FirecrawlService()
-        gemini = GeminiService()
+        firecrawl = get_firecrawl()
 
-        try:
-            # Extract both brands
+        if _normalize_url(url1) == _normalize_url(url2):
+            # Same site on both sides: scrape once and skip the comparison math
             brand1 = await firecrawl.extract_brand(url1)
-            brand2 = await firecrawl.extract_brand(url2)
-        finally:
-            await firecrawl.close()
-
-        # Calculate color similarity
-        color_similarity = await gemini.calculate_color_similarity(
-            brand1.colors.primary,
-            brand2.colors.primary,
-        )
-
-        # Check typography match
-        typography_match = (
-            brand1.typography.headings.lower() == brand2.typography.headings.lower()
-            or brand1.typography.body.lower() == brand2.typography.body.lower()
-        )
-
-        # Find font overlap
-        fonts1 = {brand1.typography.headings.lower(), brand1.typography.body.lower()}
-        fonts2 = {brand2.typography.headings.lower(), brand2.typography.body.lower()}
-        font_overlap = list(fonts1 & fonts2)
-
-        # Identify differences
-        differences = []
-        if brand1.colors.primary != brand2.colors.primary:
-            differences.append(f"Primary color: {brand1.colors.primary} vs {brand2.colors.primary}")
-        if brand1.typography.headings.lower() != brand2.typography.headings.lower():
-            differences.append(f"Heading font: {brand1.typography.headings} vs {brand2.typography.headings}")
-        if brand1.typography.body.lower() != brand2.typography.body.lower():
-            differences.append(f"Body font: {brand1.typography.body} vs {brand2.typography.body}")
-
-        comparison = BrandComparison(
-            site1=brand1,
-            site2=brand2,
-            comparison=ComparisonMetrics(
-                color_similarity=color_similarity,
-                typography_match=typography_match,
-                font_overlap=font_overlap,
-                differences=differences,
-            ),
-        )
-
-        return comparison.model_dump()
+            # Shallow copy so site2 still reports the caller's spelling of url2
+            brand2 = brand1.model_copy(update={"url": url2})
+            metrics = ComparisonMetrics(
+                color_similarity=1.0,
+                typography_match=True,
+                font_overlap=list(
+                    {brand1.typography.headings.lower(), brand1.typography.body.lower()}
+                ),
+            )
+        else:
+            # Extract both brands concurrently, setting up Gemini meanwhile
+            brand1, brand2, gemini = await asyncio.gather(
+                firecrawl.extract_brand(url1),
+                firecrawl.extract_brand(url2),
+                ensure_gemini(),
+            )
+            metrics = await _compare_brand_data(brand1, brand2, gemini)
+
+        comparison = BrandComparison(site1=brand1, site2=brand2, comparison=metrics)
+
+        return comparison.model_dump(exclude_none=True)
 
     @mcp.tool()
     async def apply_brand_to_template(url: str, template_type: str) -> dict:
@@ -169,13 +247,10 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Generated HTML and CSS for the template with applied branding
         """
-        firecrawl = FirecrawlService()
-        try:
-            brand_data = await firecrawl.extract_brand(url)
-        finally:
-            await firecrawl.close()
-
-        gemini = GeminiService()
+        brand_data, gemini = await asyncio.gather(
+            get_firecrawl().extract_brand(url),
+            ensure_gemini(),
+        )
         result = await gemini.generate_from_template(brand_data, template_type)
 
         return {
@@ -199,22 +274,16 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Brand data including colors, typography, and button styles
         """
-        firecrawl = FirecrawlService()
-        vision = VisionService()
-        try:
-            # Get screenshot via Firecrawl
-            scrape_result = await firecrawl.scrape(url, include_screenshot=True)
-            screenshot_url = scrape_result.get("data", {}).get("screenshot")
-
-            if not screenshot_url:
-                raise ValueError("Failed to capture screenshot")
-
-            # Analyze with Claude Vision
-            brand_data = await vision.analyze_brand(screenshot_url, url)
-            return brand_data.model_dump()
-        finally:
-            await firecrawl.close()
-            await vision.close()
+        # Get screenshot via Firecrawl
+        scrape_result = await get_firecrawl().scrape(url, include_screenshot=True)
+        screenshot_url = scrape_result.get("data", {}).get("screenshot")
+
+        if not screenshot_url:
+            raise ValueError("Failed to capture screenshot")
+
+        # Analyze with Claude Vision
+        brand_data = await get_vision().analyze_brand(screenshot_url, url)
+        return brand_data.model_dump(exclude_none=True)
 
     @mcp.tool()
     async def replicate_website_visual(
@@ -235,26 +304,21 @@ def register_tools(mcp: FastMCP) -> None:
         Returns:
             Both brand_data and generated HTML/CSS
         """
-        firecrawl = FirecrawlService()
-        vision = VisionService()
-        try:
-            # Get screenshot via Firecrawl
-            scrape_result = await firecrawl.scrape(url, include_screenshot=True)
-            screenshot_url = scrape_result.get("data", {}).get("screenshot")
-
-            if not screenshot_url:
-                raise ValueError("Failed to capture screenshot")
-
-            # Analyze with Claude Vision
-            brand_data = await vision.analyze_brand(screenshot_url, url)
-        finally:
-            await firecrawl.close()
-            await vision.close()
-
-        gemini = GeminiService()
+        # Get screenshot via Firecrawl
+        scrape_result = await get_firecrawl().scrape(url, include_screenshot=True)
+        screenshot_url = scrape_result.get("data", {}).get("screenshot")
+
+        if not screenshot_url:
+            raise ValueError("Failed to capture screenshot")
+
+        # Analyze with Claude Vision, setting up Gemini meanwhile
+        brand_data, gemini = await asyncio.gather(
+            get_vision().analyze_brand(screenshot_url, url),
+            ensure_gemini(),
+        )
         generated = await gemini.generate_replica(brand_data, component_type, customization)
 
         return {
-            "brand_data": brand_data.model_dump(),
-            "generated": generated.model_dump(),
+            "brand_data": brand_data.model_dump(exclude_none=True),
+            "generated": generated.model_dump(exclude_none=True),
         }
@@ -1,7 +1,13 @@
 """Pytest fixtures for mirage-brandextract-mcp tests."""
 
+import functools
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock
+from pytest_asyncio_cooperative import Lock
+
+import google.generativeai as genai
+from mcp.server.fastmcp import FastMCP
 
 from mirage.schemas.brand import (
     BrandData,
@@ -12,14 +18,74 @@ from mirage.schemas.brand import (
     ButtonStyle,
     GeneratedCode,
 )
+from mirage.services.gemini import _cached_model
+from mirage.tools import register_tools
+
+
+# Cooperative async tests interleave on one event loop, so tests that patch
+# shared module state take this lock for their whole body.
+_patch_lock = Lock()
 
 
 @pytest.fixture
-def sample_brand_data() -> BrandData:
-    """Create sample brand data for testing."""
-    return BrandData(
+async def patch_lock():
+    """Serialize tests that patch module globals or SDK attributes."""
+    async with _patch_lock():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def reset_gemini_model():
+    """Drop the cached Gemini model so SDK patches apply per test."""
+    _cached_model.cache_clear()
+    yield
+    _cached_model.cache_clear()
+
+
+@pytest.fixture
+def stub_genai(monkeypatch):
+    """Replace the Gemini SDK's configure and GenerativeModel with mocks.
+
+    Returns the parent mock, so tests can assert on ``stub_genai.configure``.
+    """
+    stub = MagicMock()
+    monkeypatch.setattr(genai, "configure", stub.configure)
+    monkeypatch.setattr(genai, "GenerativeModel", stub.GenerativeModel)
+    return stub
+
+
+@functools.cache
+def _build_registered_mcp():
+    """Build the shared FastMCP server with all tools registered."""
+    mcp = FastMCP("test")
+    register_tools(mcp)
+    return mcp
+
+
+@pytest.fixture(scope="session")
+def registered_mcp():
+    """FastMCP server with all tools registered, built once per session."""
+    return _build_registered_mcp()
+
+
+@pytest.fixture(scope="session")
+def registered_tool_names():
+    """Names of all tools registered on the shared server."""
+    # Built from the helper, not the registered_mcp fixture: the cooperative
+    # plugin rewraps session fixtures it serves as coroutines, which a sync
+    # fixture cannot consume.
+    return frozenset(t.name for t in _build_registered_mcp()._tool_manager._tools.values())
+
+
+def _build_sample_brand_data() -> BrandData:
+    """Build the sample brand.
+
+    Built with model_construct: the values are known-good, and validation has
+    its own tests in TestBrandDataSchema.
+    """
+    return BrandData.model_construct(
         url="https://example.com",
-        colors=BrandColors(
+        colors=BrandColors.model_construct(
             primary="#FF5A5F",
             secondary="#00A699",
             accent="#FC642D",
@@ -27,7 +93,7 @@ def sample_brand_data() -> BrandData:
             text="#484848",
             palette=["#FF5A5F", "#00A699", "#FC642D", "#FFFFFF", "#484848"],
         ),
-        typography=BrandTypography(
+        typography=BrandTypography.model_construct(
             headings="Circular",
             body="Circular",
             weights=[400, 500, 700],
@@ -39,7 +105,7 @@ def sample_brand_data() -> BrandData:
             margins={"sm": "8px", "md": "16px", "lg": "24px"},
             padding={"sm": "8px", "md": "16px", "lg": "24px"},
         ),
-        buttons=BrandButtons(
+        buttons=BrandButtons.model_construct(
             primary=ButtonStyle(
                 bg="#FF5A5F",
                 text="#FFFFFF",
@@ -50,6 +116,18 @@ def sample_brand_data() -> BrandData:
     )
 
 
+@pytest.fixture
+def sample_brand_data() -> BrandData:
+    """Create sample brand data for testing."""
+    return _build_sample_brand_data()
+
+
+@pytest.fixture(scope="session")
+def sample_brand_dict() -> dict:
+    """Sample brand data dumped to a dict once per session; do not mutate."""
+    return _build_sample_brand_data().model_dump()
+
+
 @pytest.fixture
 def sample_generated_code() -> GeneratedCode:
     """Create sample generated code for testing."""
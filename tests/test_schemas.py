@@ -0,0 +1,58 @@
+"""Tests for brand schemas."""
+
+import pytest
+
+from mirage.schemas.brand import (
+    BrandData,
+    BrandColors,
+    BrandTypography,
+    ButtonStyle,
+    ComparisonMetrics,
+)
+
+
+class TestBrandDataSchema:
+    """Tests for BrandData schema."""
+
+    def test_brand_data_serialization(self):
+        """Test that BrandData can be serialized to dict."""
+        brand = BrandData.model_construct(
+            url="https://example.com",
+            colors=BrandColors.model_construct(primary="#FF0000"),
+            typography=BrandTypography.model_construct(headings="Arial", body="Helvetica"),
+        )
+
+        data = brand.model_dump()
+        assert data["url"] == "https://example.com"
+        assert data["colors"]["primary"] == "#FF0000"
+        assert data["typography"]["headings"] == "Arial"
+
+    def test_brand_data_validation(self):
+        """Test that BrandData validates input."""
+        # Valid data should work
+        brand = BrandData.model_validate({
+            "url": "https://example.com",
+            "colors": {"primary": "#FF0000"},
+            "typography": {"headings": "Arial", "body": "Helvetica"},
+        })
+        assert brand.url == "https://example.com"
+
+    def test_nested_dataclasses_round_trip(self):
+        """Test that dataclass leaves validate from dicts and dump back to dicts."""
+        brand = BrandData.model_validate({
+            "url": "https://example.com",
+            "colors": {"primary": "#FF0000"},
+            "typography": {"headings": "Arial", "body": "Helvetica"},
+            "buttons": {"primary": {"bg": "#FF0000", "text": "#FFFFFF"}},
+        })
+        assert isinstance(brand.buttons.primary, ButtonStyle)
+        assert brand.buttons.primary.border_radius == "4px"
+
+        data = brand.model_dump()
+        assert data["buttons"]["primary"]["bg"] == "#FF0000"
+        assert data["spacing"]["grid"] == "8px"
+
+    def test_comparison_metrics_bounds(self):
+        """Test that color similarity must stay within 0-1."""
+        with pytest.raises(ValueError):
+            ComparisonMetrics(color_similarity=1.5, typography_match=True)
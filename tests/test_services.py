@@ -1,128 +1,372 @@
 """Tests for service layer."""
 
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
 import pytest
-from unittest.mock import patch, MagicMock
+from pydantic import ValidationError
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from mirage.schemas.brand import BrandColors
+from mirage.services import firecrawl
+from mirage.services._color_math import color_similarity, hex_to_rgb
+from mirage.services._ratelimit import AIMDController, SlidingWindow
+from mirage.services.firecrawl import FirecrawlService, _stash_screenshot
+from mirage.services.gemini import GeminiService
+from mirage.services.vision import VisionService
 
-from mirage.schemas.brand import BrandData, BrandColors, BrandTypography
+# These tests patch SDKs and module globals, so under pytest-xdist they all
+# run on one worker (with --dist loadgroup).
+pytestmark = pytest.mark.xdist_group("mock_patching")
 
 
 class TestFirecrawlService:
     """Tests for FirecrawlService."""
 
-    def test_requires_api_key(self):
+    def test_requires_api_key(self, monkeypatch):
         """Test that service requires API key."""
-        with patch.dict("os.environ", {}, clear=True):
-            with pytest.raises(ValueError, match="FIRECRAWL_API_KEY is required"):
-                from mirage.services.firecrawl import FirecrawlService
-                FirecrawlService()
+        monkeypatch.delenv("FIRECRAWL_API_KEY", raising=False)
+        with pytest.raises(ValueError, match="FIRECRAWL_API_KEY is required"):
+            FirecrawlService()
 
     def test_accepts_api_key_parameter(self):
         """Test that API key can be passed as parameter."""
-        from mirage.services.firecrawl import FirecrawlService
-
         service = FirecrawlService(api_key="test-key")
         assert service.api_key == "test-key"
 
-    def test_reads_api_key_from_env(self):
+    def test_reads_api_key_from_env(self, monkeypatch):
         """Test that API key is read from environment."""
-        with patch.dict("os.environ", {"FIRECRAWL_API_KEY": "env-key"}):
-            from mirage.services.firecrawl import FirecrawlService
-
-            service = FirecrawlService()
-            assert service.api_key == "env-key"
+        monkeypatch.setenv("FIRECRAWL_API_KEY", "env-key")
+        service = FirecrawlService()
+        assert service.api_key == "env-key"
+
+    @pytest.mark.asyncio_cooperative
+    async def test_extract_brand_caches_by_url(self):
+        """Test that repeated extractions of a URL reuse the cached result."""
+        service = FirecrawlService(api_key="test-key", cache_ttl=60)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {
+            "data": {
+                "branding": {
+                    "colors": {"primary": "#FF5A5F", "textPrimary": "#484848"},
+                    "typography": {"fontFamilies": {"primary": "Circular"}},
+                    "components": {"buttonPrimary": {"background": "#FF5A5F"}},
+                }
+            }
+        }
+        service.client.post = AsyncMock(return_value=response)
+
+        first = await service.extract_brand("https://example.com")
+        second = await service.extract_brand("https://example.com")
+
+        assert first is second
+        assert first.colors.primary == "#FF5A5F"
+        assert first.colors.text == "#484848"
+        assert first.typography.headings == "Circular"
+        assert first.buttons.primary.bg == "#FF5A5F"
+        service.client.post.assert_awaited_once()
+
+        await service.extract_brand("https://example.com", include_screenshots=True)
+        assert service.client.post.await_count == 2
+
+    @pytest.mark.asyncio_cooperative
+    async def test_extract_brand_stashes_inline_screenshot(self, patch_lock, monkeypatch):
+        """Test that base64 screenshots are written to disk and returned by reference."""
+        image = b"\x89PNG fake image"
+        encoded = base64.b64encode(image).decode()
+
+        service = FirecrawlService(api_key="test-key", cache_ttl=0)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {
+            "data": {"branding": {}, "screenshot": f"data:image/png;base64,{encoded}"}
+        }
+        service.client.post = AsyncMock(return_value=response)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            screenshot_dir = Path(tmp)
+            monkeypatch.setattr(firecrawl, "_screenshot_dir", screenshot_dir)
+
+            brand = await service.extract_brand("https://example.com", include_screenshots=True)
+
+            assert len(brand.screenshots) == 1
+            reference = brand.screenshots[0]
+            assert reference.startswith("file://")
+            assert reference.endswith(".png")
+            files = list(screenshot_dir.iterdir())
+            assert len(files) == 1
+            assert files[0].read_bytes() == image
+
+    def test_stash_screenshot_keeps_urls(self):
+        """Test that hosted screenshot URLs pass through untouched."""
+        url = "https://storage.example.com/shot.png"
+        assert _stash_screenshot(url) == url
+
+    @pytest.mark.parametrize(
+        "screenshot",
+        [
+            "data:image/png;base64,not*base64",
+            "data:image/png;base64,iVBORw0",
+            "data:image/svg+xml;base64,PHN2Zy8+",
+            "data:image/png,raw-bytes",
+        ],
+    )
+    def test_stash_screenshot_keeps_unusable_data_urls(self, screenshot, monkeypatch):
+        """Test that malformed or unsupported data URLs are returned unchanged."""
+        monkeypatch.setattr(firecrawl, "_get_screenshot_dir", MagicMock())
+        assert _stash_screenshot(screenshot) == screenshot
+        firecrawl._get_screenshot_dir.assert_not_called()
+
+    def test_stash_screenshot_ignores_header_parameters(self, monkeypatch):
+        """Test that extra data-URL parameters do not leak into the filename."""
+        encoded = base64.b64encode(b"\xff\xd8 fake jpeg").decode()
+        with tempfile.TemporaryDirectory() as tmp:
+            monkeypatch.setattr(firecrawl, "_screenshot_dir", Path(tmp))
+
+            reference = _stash_screenshot(f"data:image/jpeg;name=shot.svg;base64,{encoded}")
+
+            assert reference.startswith(Path(tmp).as_uri())
+            assert reference.endswith(".jpg")
+
+    def test_stash_screenshot_prunes_oldest_files(self, monkeypatch):
+        """Test that the screenshot directory is capped, dropping the oldest files."""
+        monkeypatch.setattr(firecrawl, "SCREENSHOT_MAX_FILES", 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            monkeypatch.setattr(firecrawl, "_screenshot_dir", Path(tmp))
+
+            paths = []
+            for mtime, image in enumerate((b"first", b"second", b"third"), start=1):
+                encoded = base64.b64encode(image).decode()
+                reference = _stash_screenshot(f"data:image/png;base64,{encoded}")
+                paths.append(Path(tmp) / reference.rpartition("/")[2])
+                os.utime(paths[-1], (mtime, mtime))
+
+            assert not paths[0].exists()
+            assert paths[1].exists()
+            assert paths[2].exists()
+
+    def test_screenshot_dir_is_private(self, monkeypatch):
+        """Test that the screenshot directory is unique to the process and owner-only."""
+        with tempfile.TemporaryDirectory() as tmp:
+            monkeypatch.setattr(tempfile, "tempdir", tmp)
+            monkeypatch.setattr(firecrawl, "_screenshot_dir", None)
+
+            screenshot_dir = firecrawl._get_screenshot_dir()
+
+            assert screenshot_dir.parent == Path(tmp)
+            assert screenshot_dir.name.startswith("mirage-")
+            assert screenshot_dir.stat().st_mode & 0o777 == 0o700
+            assert firecrawl._get_screenshot_dir() is screenshot_dir
+
+    @pytest.mark.asyncio_cooperative
+    async def test_concurrent_extractions_share_one_scrape(self):
+        """Test that overlapping extractions of a URL wait on the same request."""
+        service = FirecrawlService(api_key="test-key", cache_ttl=0)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {"data": {"branding": {}}}
+        release = asyncio.Event()
+
+        async def slow_post(*args, **kwargs):
+            await release.wait()
+            return response
+
+        service.client.post = AsyncMock(side_effect=slow_post)
+
+        first = asyncio.create_task(service.extract_brand("https://example.com"))
+        second = asyncio.create_task(service.extract_brand("https://example.com"))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await first is await second
+        assert service.client.post.await_count == 1
+        assert not service._pending
+
+    @pytest.mark.asyncio_cooperative
+    async def test_extract_brand_cache_disabled(self):
+        """Test that a zero TTL disables caching."""
+        service = FirecrawlService(api_key="test-key", cache_ttl=0)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {"data": {"branding": {}}}
+        service.client.post = AsyncMock(return_value=response)
+
+        await service.extract_brand("https://example.com")
+        await service.extract_brand("https://example.com")
+
+        assert service.client.post.await_count == 2
 
 
 class TestGeminiService:
     """Tests for GeminiService."""
 
-    def test_requires_api_key(self):
+    def test_requires_api_key(self, monkeypatch):
         """Test that service requires API key."""
-        with patch.dict("os.environ", {}, clear=True):
-            with pytest.raises(ValueError, match="GOOGLE_API_KEY is required"):
-                from mirage.services.gemini import GeminiService
-                GeminiService()
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+        with pytest.raises(ValueError, match="GOOGLE_API_KEY is required"):
+            GeminiService()
 
-    def test_accepts_api_key_parameter(self):
+    def test_accepts_api_key_parameter(self, stub_genai):
         """Test that API key can be passed as parameter."""
-        with patch("google.generativeai.configure"):
-            with patch("google.generativeai.GenerativeModel"):
-                from mirage.services.gemini import GeminiService
+        service = GeminiService(api_key="test-key")
+        assert service.api_key == "test-key"
 
-                service = GeminiService(api_key="test-key")
-                assert service.api_key == "test-key"
+    def test_model_is_shared_between_instances(self, stub_genai):
+        """Test that the SDK is configured once and the model reused."""
+        first = GeminiService(api_key="test-key")
+        second = GeminiService(api_key="test-key")
+
+        assert first.model is second.model
+        stub_genai.configure.assert_called_once_with(api_key="test-key")
+
+    def test_css_variables_cached_per_brand(self, stub_genai, sample_brand_data):
+        """Test that CSS variables are built once per distinct brand."""
+        service = GeminiService(api_key="test-key")
+        with patch.object(
+            service, "_brand_to_css_variables", wraps=service._brand_to_css_variables
+        ) as build:
+            first = service._css_variables_for(sample_brand_data)
+            second = service._css_variables_for(sample_brand_data.model_copy())
+            assert first is second
+            assert build.call_count == 1
+
+            other = sample_brand_data.model_copy(
+                update={"colors": BrandColors(primary="#000000")}
+            )
+            assert "--color-primary: #000000;" in service._css_variables_for(other)
+            assert build.call_count == 2
+
+    @pytest.mark.asyncio_cooperative
+    async def test_generate_replica_parses_response(
+        self, patch_lock, stub_genai, sample_brand_data
+    ):
+        """Test that generated HTML/CSS is parsed and wrapped in a preview."""
+        service = GeminiService(api_key="test-key")
+        response = MagicMock()
+        response.text = (
+            "---HTML---\n<h1>Hi</h1>\n---CSS---\nh1 { color: red; }\n---END---"
+        )
+        service.model.generate_content_async = AsyncMock(return_value=response)
+
+        result = await service.generate_replica(sample_brand_data, "card")
+
+        assert result.html == "<h1>Hi</h1>"
+        assert result.css.startswith(":root {\n  --color-primary: #FF5A5F;")
+        assert result.css.endswith("h1 { color: red; }")
+        assert result.component_type == "card"
+
+        prefix = "data:text/html;base64,"
+        assert result.preview_url.startswith(prefix)
+        preview = base64.b64decode(result.preview_url[len(prefix):]).decode()
+        assert preview.startswith("<!DOCTYPE html>")
+        assert f"<style>{result.css}</style>" in preview
+        assert "<body>\n<h1>Hi</h1>\n</body>" in preview
+
+        prompt = service.model.generate_content_async.call_args.args[0]
+        assert prompt.startswith("Generate a card component")
+        assert prompt.endswith("---END---\n")
+
+    @pytest.mark.asyncio_cooperative
+    async def test_generate_replica_falls_back_to_code_blocks(
+        self, patch_lock, stub_genai, sample_brand_data
+    ):
+        """Test parsing when the model answers with fenced code blocks."""
+        service = GeminiService(api_key="test-key")
+        response = MagicMock()
+        response.text = (
+            "Here you go:\n```html\n<p>Hi</p>\n```\nand\n```css\np { margin: 0; }\n```"
+        )
+        service.model.generate_content_async = AsyncMock(return_value=response)
 
-    @pytest.mark.asyncio
-    async def test_calculate_color_similarity(self):
-        """Test color similarity calculation."""
-        with patch("google.generativeai.configure"):
-            with patch("google.generativeai.GenerativeModel"):
-                from mirage.services.gemini import GeminiService
+        result = await service.generate_replica(sample_brand_data)
 
-                service = GeminiService(api_key="test-key")
+        assert result.html == "<p>Hi</p>"
+        assert result.css.endswith("p { margin: 0; }")
 
-                # Same color should have similarity 1.0
-                similarity = await service.calculate_color_similarity("#FF0000", "#FF0000")
-                assert similarity == 1.0
 
-                # Very different colors should have low similarity
-                similarity = await service.calculate_color_similarity("#000000", "#FFFFFF")
-                assert similarity < 0.5
+class TestRateLimit:
+    """Tests for rate limiting helpers."""
 
-                # Similar colors should have high similarity
-                similarity = await service.calculate_color_similarity("#FF0000", "#FF1111")
-                assert similarity > 0.9
+    def test_aimd_increases_and_decreases(self):
+        """Test additive increase on success and multiplicative decrease on 429."""
+        controller = AIMDController(c_min=1, c_max=8, alpha=1.0, beta=0.5, initial=4)
 
+        controller.record(0.1, 200)
+        assert controller.limit == 5
 
-class TestBrandDataSchema:
-    """Tests for BrandData schema."""
+        controller.record(0.1, 429)
+        assert controller.limit == 2
+
+        for _ in range(20):
+            controller.record(0.1, 200)
+        assert controller.limit == 8
+
+    def test_aimd_backs_off_on_low_remaining_quota(self):
+        """Test that rate-limit headers reporting a nearly spent quota reduce the limit."""
+        controller = AIMDController(initial=8, beta=0.5)
+        controller.record(0.1, 200, {"X-RateLimit-Remaining": "5", "X-RateLimit-Limit": "100"})
+        assert controller.limit == 4
+
+    @pytest.mark.asyncio_cooperative
+    async def test_sliding_window_blocks_over_limit(self):
+        """Test that requests past the per-window limit wait for the window to slide."""
+        window = SlidingWindow(rpm_limit=2, window=0.2)
+        start = time.monotonic()
+        await window.wait()
+        await window.wait()
+        assert time.monotonic() - start < 0.1
+
+        await window.wait()
+        assert time.monotonic() - start >= 0.15
 
-    def test_brand_data_serialization(self):
-        """Test that BrandData can be serialized to dict."""
-        brand = BrandData(
-            url="https://example.com",
-            colors=BrandColors(primary="#FF0000"),
-            typography=BrandTypography(headings="Arial", body="Helvetica"),
-        )
 
-        data = brand.model_dump()
-        assert data["url"] == "https://example.com"
-        assert data["colors"]["primary"] == "#FF0000"
-        assert data["typography"]["headings"] == "Arial"
+class TestColorMath:
+    """Tests for color math helpers."""
 
-    def test_brand_data_validation(self):
-        """Test that BrandData validates input."""
-        # Valid data should work
-        brand = BrandData.model_validate({
-            "url": "https://example.com",
-            "colors": {"primary": "#FF0000"},
-            "typography": {"headings": "Arial", "body": "Helvetica"},
-        })
-        assert brand.url == "https://example.com"
+    def test_hex_to_rgb(self):
+        """Test hex parsing with and without the leading #."""
+        assert tuple(hex_to_rgb("#FF5A5F")) == (255, 90, 95)
+        assert tuple(hex_to_rgb("00a699")) == (0, 166, 153)
+
+    def test_hex_to_rgb_rejects_short_colors(self):
+        """Test that shorthand or malformed colors are rejected."""
+        with pytest.raises(ValueError):
+            hex_to_rgb("#FFF")
+        with pytest.raises(ValueError):
+            hex_to_rgb("transparent")
+
+    def test_color_similarity(self):
+        """Test color similarity calculation."""
+        # Same color should have similarity 1.0
+        assert color_similarity("#FF0000", "#FF0000") == 1.0
+
+        # Very different colors should have low similarity
+        assert color_similarity("#000000", "#FFFFFF") < 0.5
+
+        # Similar colors should have high similarity
+        assert color_similarity("#FF0000", "#FF1111") > 0.9
 
 
 class TestVisionService:
     """Tests for VisionService."""
 
-    def test_requires_api_key(self):
+    def test_requires_api_key(self, monkeypatch):
         """Test that service requires API key."""
-        with patch.dict("os.environ", {}, clear=True):
-            with pytest.raises(ValueError, match="ANTHROPIC_API_KEY is required"):
-                from mirage.services.vision import VisionService
-                VisionService()
+        monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+        with pytest.raises(ValueError, match="ANTHROPIC_API_KEY is required"):
+            VisionService()
 
     def test_accepts_api_key_parameter(self):
         """Test that API key can be passed as parameter."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
             assert service.api_key == "test-key"
 
     def test_build_extraction_prompt(self):
         """Test that extraction prompt is well-formed."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
             prompt = service._build_extraction_prompt()
 
@@ -135,8 +379,6 @@ class TestVisionService:
     def test_parse_response_valid_json(self):
         """Test parsing valid JSON response."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
 
             response = '''
@@ -174,11 +416,28 @@ class TestVisionService:
             assert result.url == "https://example.com"
             assert "https://screenshot.url/img.png" in result.screenshots
 
+    @pytest.mark.parametrize("button", [{"bg": None}, {"bg": "#FF5A5F", "border_radius": 8}])
+    def test_parse_response_validates_buttons(self, button):
+        """Test that malformed button styles in the reply are rejected."""
+        with patch("anthropic.AsyncAnthropic"):
+            service = VisionService(api_key="test-key")
+
+            response = json.dumps({
+                "colors": {"primary": "#FF5A5F"},
+                "typography": {"headings": "Circular", "body": "Circular"},
+                "buttons": {"primary": button},
+            })
+
+            with pytest.raises(ValidationError):
+                service._parse_response(
+                    response,
+                    "https://example.com",
+                    "https://screenshot.url/img.png"
+                )
+
     def test_parse_response_with_markdown_code_block(self):
         """Test parsing response wrapped in markdown code blocks."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
 
             response = '''```json
@@ -208,8 +467,6 @@ class TestVisionService:
     def test_parse_response_invalid_json_returns_defaults(self):
         """Test that invalid JSON returns default brand data."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
 
             result = service._parse_response(
@@ -225,8 +482,6 @@ class TestVisionService:
     def test_default_brand_data(self):
         """Test default brand data factory."""
         with patch("anthropic.AsyncAnthropic"):
-            from mirage.services.vision import VisionService
-
             service = VisionService(api_key="test-key")
 
             result = service._default_brand_data(
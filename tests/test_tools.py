@@ -1,120 +1,400 @@
 """Tests for MCP tools."""
 
+import asyncio
+import threading
+import warnings
+
 import pytest
-from unittest.mock import patch, AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from mirage.schemas.brand import BrandData, GeneratedCode
+import server
+from mirage import tools
+from mirage.schemas.brand import BrandColors, BrandTypography
+from mirage.services.firecrawl import FirecrawlService
 
 
-class TestExtractBrand:
-    """Tests for extract_brand tool."""
+class TestToolRegistration:
+    """Tests for tool registration."""
 
-    @pytest.mark.asyncio
-    async def test_extract_brand_returns_dict(self, sample_brand_data):
-        """Test that extract_brand returns a dictionary."""
-        with patch("mirage.tools.FirecrawlService") as MockService:
-            mock_instance = MagicMock()
-            mock_instance.extract_brand = AsyncMock(return_value=sample_brand_data)
-            mock_instance.close = AsyncMock()
-            MockService.return_value = mock_instance
+    @pytest.mark.parametrize(
+        "name",
+        [
+            "extract_brand",
+            "generate_replica",
+            "replicate_website",
+            "compare_brands",
+            "apply_brand_to_template",
+        ],
+    )
+    def test_tool_registered(self, registered_tool_names, name):
+        """Test that each tool is registered."""
+        assert name in registered_tool_names
 
-            from mirage.tools import register_tools
-            from mcp.server.fastmcp import FastMCP
+    def test_all_tools_registered(self, registered_tool_names):
+        """Test that all 5 tools are registered."""
+        expected_tools = {
+            "extract_brand",
+            "generate_replica",
+            "replicate_website",
+            "compare_brands",
+            "apply_brand_to_template",
+        }
 
-            mcp = FastMCP("test")
-            register_tools(mcp)
+        assert expected_tools <= registered_tool_names, (
+            f"Tools not registered: {expected_tools - registered_tool_names}"
+        )
 
-            # The tool should be registered
-            assert "extract_brand" in [t.name for t in mcp._tool_manager._tools.values()]
 
+class TestServiceSingletons:
+    """Tests for shared service instances."""
 
-class TestGenerateReplica:
-    """Tests for generate_replica tool."""
+    @pytest.mark.asyncio_cooperative
+    async def test_get_firecrawl_reuses_instance(self, patch_lock, monkeypatch):
+        """Test that the Firecrawl service is created once and reset on close."""
+        monkeypatch.setenv("FIRECRAWL_API_KEY", "test-key")
+        first = tools.get_firecrawl()
+        assert tools.get_firecrawl() is first
 
-    @pytest.mark.asyncio
-    async def test_generate_replica_accepts_brand_dict(self, sample_brand_data, sample_generated_code):
-        """Test that generate_replica works with dict input."""
-        with patch("mirage.tools.GeminiService") as MockService:
-            mock_instance = MagicMock()
-            mock_instance.generate_replica = AsyncMock(return_value=sample_generated_code)
-            MockService.return_value = mock_instance
+        await tools.close_services()
+        assert tools._firecrawl is None
 
-            from mirage.tools import register_tools
-            from mcp.server.fastmcp import FastMCP
+    @pytest.mark.asyncio_cooperative
+    async def test_session_end_keeps_services_open(self, patch_lock, monkeypatch):
+        """Test that one session ending does not close clients another session is using."""
+        monkeypatch.setenv("FIRECRAWL_API_KEY", "test-key")
+        lowlevel = server.create_server()._mcp_server
+        release = asyncio.Event()
 
-            mcp = FastMCP("test")
-            register_tools(mcp)
+        async def slow_post(*args, **kwargs):
+            await release.wait()
+            return MagicMock(status_code=200, headers={})
 
-            assert "generate_replica" in [t.name for t in mcp._tool_manager._tools.values()]
+        try:
+            async with lowlevel.lifespan(lowlevel):
+                firecrawl = tools.get_firecrawl()
+                firecrawl.client.post = slow_post
+                in_flight = asyncio.create_task(firecrawl.scrape("https://example.com"))
+                await asyncio.sleep(0)
 
+                # A second session connects and disconnects mid-call
+                async with lowlevel.lifespan(lowlevel):
+                    pass
 
-class TestReplicateWebsite:
-    """Tests for replicate_website tool."""
+                release.set()
+                await in_flight
+                assert tools._firecrawl is firecrawl
+                assert not firecrawl.client.is_closed
+        finally:
+            await tools.close_services()
 
-    @pytest.mark.asyncio
-    async def test_replicate_website_combines_extract_and_generate(
-        self, sample_brand_data, sample_generated_code
-    ):
-        """Test that replicate_website combines both operations."""
-        from mirage.tools import register_tools
-        from mcp.server.fastmcp import FastMCP
+    @pytest.mark.asyncio_cooperative
+    async def test_serve_closes_services_on_shutdown(self, patch_lock, monkeypatch):
+        """Test that the shared clients are closed when the server process stops."""
+        monkeypatch.setenv("FIRECRAWL_API_KEY", "test-key")
+        monkeypatch.setattr(server.mcp, "run_stdio_async", AsyncMock())
+        firecrawl = tools.get_firecrawl()
 
-        mcp = FastMCP("test")
-        register_tools(mcp)
+        await server.serve()
 
-        assert "replicate_website" in [t.name for t in mcp._tool_manager._tools.values()]
+        assert tools._firecrawl is None
+        assert firecrawl.client.is_closed
 
 
-class TestCompareBrands:
-    """Tests for compare_brands tool."""
+class TestExtractBrand:
+    """Tests for the extract_brand tool."""
 
-    @pytest.mark.asyncio
-    async def test_compare_brands_returns_comparison(self):
-        """Test that compare_brands returns comparison data."""
-        from mirage.tools import register_tools
-        from mcp.server.fastmcp import FastMCP
+    @pytest.mark.asyncio_cooperative
+    async def test_extract_brand_returns_dict(
+        self, patch_lock, registered_mcp, mock_firecrawl_service, sample_brand_data, monkeypatch
+    ):
+        """Test that extract_brand returns the brand as a dict without null fields."""
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        extract = registered_mcp._tool_manager._tools["extract_brand"].fn
 
-        mcp = FastMCP("test")
-        register_tools(mcp)
+        result = await extract("https://example.com")
 
-        assert "compare_brands" in [t.name for t in mcp._tool_manager._tools.values()]
+        mock_firecrawl_service.extract_brand.assert_awaited_once_with("https://example.com", False)
+        assert result == sample_brand_data.model_dump(exclude_none=True)
 
 
-class TestApplyBrandToTemplate:
-    """Tests for apply_brand_to_template tool."""
+class TestExtractThenGenerate:
+    """Tests for feeding extract_brand output back into generate_replica."""
 
-    @pytest.mark.asyncio
-    async def test_apply_brand_to_template_supports_all_types(self):
-        """Test that all template types are supported."""
-        from mirage.tools import register_tools
-        from mcp.server.fastmcp import FastMCP
+    @pytest.mark.asyncio_cooperative
+    async def test_null_and_numeric_branding_round_trips(
+        self, patch_lock, registered_mcp, mock_gemini_service, monkeypatch
+    ):
+        """Test that nulls and bare numbers from Firecrawl still yield valid brand data."""
+        firecrawl = FirecrawlService(api_key="test-key", cache_ttl=0)
+        response = MagicMock(status_code=200, headers={})
+        response.json.return_value = {
+            "data": {
+                "branding": {
+                    "colors": {"primary": "#FF5A5F", "textPrimary": None},
+                    "typography": {
+                        "fontFamilies": {"primary": "Circular", "heading": None},
+                        "fontWeights": {"regular": "400", "bold": "bold"},
+                        "fontSizes": {"body": 16},
+                    },
+                    "spacing": {"baseUnit": 4, "borderRadius": 8},
+                    "components": {
+                        "buttonPrimary": {"background": None, "borderRadius": 6},
+                        "buttonSecondary": {"textColor": None, "borderColor": None},
+                    },
+                }
+            }
+        }
+        firecrawl.client.post = AsyncMock(return_value=response)
+        monkeypatch.setattr(tools, "_firecrawl", firecrawl)
+        monkeypatch.setattr(tools, "_gemini", mock_gemini_service)
+        tool_manager = registered_mcp._tool_manager
+
+        with warnings.catch_warnings():
+            # Pydantic warns on dump when a value does not match its field type
+            warnings.simplefilter("error")
+            brand_data = await tool_manager.call_tool(
+                "extract_brand", {"url": "https://example.com"}
+            )
+            await tool_manager.call_tool("generate_replica", {"brand_data": brand_data})
+
+        brand = mock_gemini_service.generate_replica.await_args.args[0]
+        assert brand.typography.headings == "Circular"
+        assert brand.typography.weights == [400]
+        assert brand.typography.base_size == "16px"
+        assert brand.spacing.grid == "4px"
+        assert brand.spacing.gap == "8px"
+        assert brand.buttons.primary.bg == "#FF5A5F"
+        assert brand.buttons.primary.border_radius == "6px"
+        assert brand.buttons.secondary.text == "#FF5A5F"
+        assert brand.buttons.secondary.border is None
 
-        mcp = FastMCP("test")
-        register_tools(mcp)
 
-        assert "apply_brand_to_template" in [t.name for t in mcp._tool_manager._tools.values()]
+class TestReplicateWebsite:
+    """Tests for the replicate_website tool."""
 
+    @pytest.mark.asyncio_cooperative
+    async def test_replicate_website_combines_extract_and_generate(
+        self,
+        patch_lock,
+        registered_mcp,
+        mock_firecrawl_service,
+        mock_gemini_service,
+        sample_brand_data,
+        sample_generated_code,
+        monkeypatch,
+    ):
+        """Test that the scraped brand is fed to the generator and both are returned."""
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        monkeypatch.setattr(tools, "_gemini", mock_gemini_service)
+        replicate = registered_mcp._tool_manager._tools["replicate_website"].fn
 
-class TestToolRegistration:
-    """Tests for tool registration."""
+        result = await replicate("https://example.com", "card", "dark mode")
 
-    def test_all_tools_registered(self):
-        """Test that all 5 tools are registered."""
-        from mirage.tools import register_tools
-        from mcp.server.fastmcp import FastMCP
+        mock_firecrawl_service.extract_brand.assert_awaited_once_with(
+            "https://example.com", include_screenshots=False
+        )
+        mock_gemini_service.generate_replica.assert_awaited_once_with(
+            sample_brand_data, "card", "dark mode"
+        )
+        assert result == {
+            "brand_data": sample_brand_data.model_dump(exclude_none=True),
+            "generated": sample_generated_code.model_dump(exclude_none=True),
+        }
 
-        mcp = FastMCP("test")
-        register_tools(mcp)
 
-        tool_names = [t.name for t in mcp._tool_manager._tools.values()]
+class TestApplyBrandToTemplate:
+    """Tests for the apply_brand_to_template tool."""
+
+    @pytest.mark.asyncio_cooperative
+    async def test_apply_brand_to_template_returns_template(
+        self,
+        patch_lock,
+        registered_mcp,
+        mock_firecrawl_service,
+        mock_gemini_service,
+        sample_brand_data,
+        sample_generated_code,
+        monkeypatch,
+    ):
+        """Test that the scraped brand is applied to the requested template."""
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        monkeypatch.setattr(tools, "_gemini", mock_gemini_service)
+        apply_template = registered_mcp._tool_manager._tools["apply_brand_to_template"].fn
+
+        result = await apply_template("https://example.com", "pricing_table")
+
+        mock_firecrawl_service.extract_brand.assert_awaited_once_with("https://example.com")
+        mock_gemini_service.generate_from_template.assert_awaited_once_with(
+            sample_brand_data, "pricing_table"
+        )
+        assert result == {
+            "html": sample_generated_code.html,
+            "css": sample_generated_code.css,
+            "preview_url": sample_generated_code.preview_url,
+            "template_type": "pricing_table",
+            "source_url": "https://example.com",
+        }
 
-        expected_tools = [
-            "extract_brand",
-            "generate_replica",
-            "replicate_website",
-            "compare_brands",
-            "apply_brand_to_template",
-        ]
 
-        for tool in expected_tools:
-            assert tool in tool_names, f"Tool {tool} not registered"
+class TestCompareBrands:
+    """Tests for comparing two different sites."""
+
+    @pytest.mark.asyncio_cooperative
+    async def test_compare_brands_reports_differences(
+        self,
+        patch_lock,
+        registered_mcp,
+        mock_firecrawl_service,
+        mock_gemini_service,
+        sample_brand_data,
+        monkeypatch,
+    ):
+        """Test that both sites are extracted and their differences reported."""
+        other = sample_brand_data.model_copy(
+            update={
+                "url": "https://other.com",
+                "colors": BrandColors.model_construct(primary="#000000"),
+                "typography": BrandTypography.model_construct(headings="Inter", body="Circular"),
+            }
+        )
+        brands = {"https://example.com": sample_brand_data, "https://other.com": other}
+        mock_firecrawl_service.extract_brand.side_effect = lambda url: brands[url]
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        monkeypatch.setattr(tools, "_gemini", mock_gemini_service)
+        compare = registered_mcp._tool_manager._tools["compare_brands"].fn
+
+        result = await compare("https://example.com", "https://other.com")
+
+        assert mock_firecrawl_service.extract_brand.await_count == 2
+        mock_gemini_service.calculate_color_similarity.assert_awaited_once_with(
+            "#FF5A5F", "#000000"
+        )
+        assert result["site1"]["url"] == "https://example.com"
+        assert result["site2"]["url"] == "https://other.com"
+        assert result["comparison"] == {
+            "color_similarity": 0.85,
+            "typography_match": True,
+            "font_overlap": ["circular"],
+            "differences": [
+                "Primary color: #FF5A5F vs #000000",
+                "Heading font: Circular vs Inter",
+            ],
+        }
+
+
+class TestGeminiSetupOverlap:
+    """Tests that first-time Gemini setup runs off the event loop."""
+
+    @staticmethod
+    def _stub_get_gemini(monkeypatch, gemini):
+        """Replace get_gemini with one that records the thread it runs on."""
+        threads = []
+
+        def get_gemini():
+            threads.append(threading.get_ident())
+            return gemini
+
+        monkeypatch.setattr(tools, "_gemini", None)
+        monkeypatch.setattr(tools, "get_gemini", get_gemini)
+        return threads
+
+    @pytest.mark.asyncio_cooperative
+    async def test_compare_brands_sets_up_gemini_in_worker_thread(
+        self, patch_lock, registered_mcp, mock_firecrawl_service, mock_gemini_service, monkeypatch
+    ):
+        """Test that compare_brands builds Gemini alongside the two scrapes."""
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        threads = self._stub_get_gemini(monkeypatch, mock_gemini_service)
+        compare = registered_mcp._tool_manager._tools["compare_brands"].fn
+
+        await compare("https://example.com", "https://other.com")
+
+        assert threads and threading.get_ident() not in threads
+        mock_gemini_service.calculate_color_similarity.assert_awaited_once()
+
+    @pytest.mark.asyncio_cooperative
+    async def test_replicate_website_visual_sets_up_gemini_in_worker_thread(
+        self,
+        patch_lock,
+        registered_mcp,
+        mock_firecrawl_service,
+        mock_gemini_service,
+        mock_vision_service,
+        sample_brand_data,
+        monkeypatch,
+    ):
+        """Test that replicate_website_visual builds Gemini alongside the vision call."""
+        mock_firecrawl_service.scrape = AsyncMock(
+            return_value={"data": {"screenshot": "https://shots.example.com/1.png"}}
+        )
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        monkeypatch.setattr(tools, "_vision", mock_vision_service)
+        threads = self._stub_get_gemini(monkeypatch, mock_gemini_service)
+        replicate = registered_mcp._tool_manager._tools["replicate_website_visual"].fn
+
+        await replicate("https://example.com", "card")
+
+        assert threads and threading.get_ident() not in threads
+        mock_vision_service.analyze_brand.assert_awaited_once_with(
+            "https://shots.example.com/1.png", "https://example.com"
+        )
+        mock_gemini_service.generate_replica.assert_awaited_once_with(
+            sample_brand_data, "card", ""
+        )
+
+
+class TestCompareBrandsSameUrl:
+    """Tests for comparing a site with itself."""
+
+    @pytest.mark.asyncio_cooperative
+    async def test_same_url_scrapes_once(
+        self, patch_lock, registered_mcp, mock_firecrawl_service, monkeypatch
+    ):
+        """Test that equivalent URLs share one scrape and compare as identical."""
+        monkeypatch.setattr(tools, "_firecrawl", mock_firecrawl_service)
+        compare = registered_mcp._tool_manager._tools["compare_brands"].fn
+
+        with patch("mirage.tools.GeminiService") as MockGemini:
+            result = await compare("https://example.com", "https://Example.com/")
+
+        mock_firecrawl_service.extract_brand.assert_awaited_once()
+        MockGemini.assert_not_called()
+        assert result["site1"]["url"] == "https://example.com"
+        assert result["site2"]["url"] == "https://Example.com/"
+        assert result["site1"]["colors"] == result["site2"]["colors"]
+        assert result["comparison"]["color_similarity"] == 1.0
+        assert result["comparison"]["typography_match"] is True
+        assert result["comparison"]["font_overlap"] == ["circular"]
+        assert result["comparison"]["differences"] == []
+
+
+class TestGenerateReplicaInput:
+    """Tests for generate_replica input handling."""
+
+    @pytest.mark.asyncio_cooperative
+    async def test_accepts_dict_and_json_string(
+        self,
+        patch_lock,
+        registered_mcp,
+        sample_brand_data,
+        sample_brand_dict,
+        mock_gemini_service,
+        monkeypatch,
+    ):
+        """Test that brand data validates the same from a dict or a JSON string.
+
+        Strings arrive through FastMCP, which parses JSON arguments before the
+        tool sees them.
+        """
+        monkeypatch.setattr(tools, "_gemini", mock_gemini_service)
+        tool_manager = registered_mcp._tool_manager
+
+        await tool_manager.call_tool("generate_replica", {"brand_data": sample_brand_dict})
+        await tool_manager.call_tool(
+            "generate_replica", {"brand_data": sample_brand_data.model_dump_json()}
+        )
+
+        from_dict, from_json = (
+            call.args[0] for call in mock_gemini_service.generate_replica.await_args_list
+        )
+        assert from_dict == from_json == sample_brand_data